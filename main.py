@@ -19,14 +19,14 @@ from dotenv import load_dotenv
 import os
 import serial
 import time
+import math
 import sys
 import argparse
 from collections import deque
+import numpy as np
 
 from PyQt6 import QtWidgets, QtCore
 from PyQt6.QtWidgets import QLabel, QVBoxLayout, QWidget, QApplication, QGridLayout, QFrame
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
 
 load_dotenv()
 
@@ -34,32 +34,50 @@ port = os.getenv("PORT", "/dev/ttyUSB0")
 baudrate = float(os.getenv("BAUDRATE", 115200))
 timeout = float(os.getenv("TIMEOUT", 0.2))
 graph = os.getenv("GRAPH", "False").lower() in ("true", "1", "yes")
+plot_skip = max(1, int(os.getenv("PLOT_SKIP", 4)))
 
-# Envoie une commande SCPI au multimètre, lit la réponse brute en binaire,
-# et gère le décodage des caractères invalides (erreurs de type Unicode)
-# Le timeout court (0.2s) permet une lecture réactive même si l'appareil ne répond pas tout de suite.
-def envoyer_commande(ser, commande):
-    ser.write((commande + '\n').encode('ascii'))
-    time.sleep(0.05)
-    reponse = ser.read(128)
-    return reponse.decode(errors='backslashreplace').strip()
+# Fenêtre de l'historique graphique (secondes) et période de rafraîchissement (ms).
+# La période est doublée à chaque erreur de lecture, jusqu'à INTERVALLE_MAX_MS,
+# et revient à INTERVALLE_MS dès qu'une lecture réussit.
+FENETRE_HISTORIQUE = 60
+INTERVALLE_MS = 100
+INTERVALLE_MAX_MS = 2000
+# Variation relative minimale des limites Y avant de redimensionner l'axe
+SEUIL_YLIM = 0.02
+# Avance (secondes) laissée à droite de l'axe X : il n'est décalé qu'une fois cette marge consommée
+AVANCE_XLIM = 2.0
+# Capacité du tampon circulaire de l'historique, dimensionnée pour la période la plus courte.
+# Elle ne garantit pas la fenêtre de temps : une lecture peut durer plus que INTERVALLE_MS
+# (trois timeouts au pire), c'est ajouter_point() qui écarte les points trop anciens.
+TAILLE_HISTORIQUE = int(FENETRE_HISTORIQUE * 1000 / INTERVALLE_MS) + 4
 
-def formater_mesure(valeur, unite):
-    try:
-        if valeur.startswith("1E+9"):
-            return "Surcharge"
-        val = float(valeur)
-        return f"{val:.3f} {unite}"
-    except ValueError:
-        return valeur
+# Commandes SCPI encodées une fois pour toutes (terminées par un saut de ligne)
+_CMD_FUNC1 = b"FUNC1?\n"
+_CMD_RANGE = b"RANGE?\n"
+_CMD_MEAS1 = b"MEAS1?\n"
+# Requête groupée envoyée à chaque lecture : mode, plage, mesure
+_CMD_LECTURE = _CMD_FUNC1 + _CMD_RANGE + _CMD_MEAS1
 
-def extraire_float(valeur):
+# Envoie plusieurs commandes SCPI déjà encodées d'un seul coup (ex. _CMD_LECTURE)
+# puis lit les nb_reponses réponses dans l'ordre. L'appareil met les requêtes en file
+# d'attente : on ne paie qu'un aller-retour série au lieu d'un par commande.
+# Chaque réponse est lue jusqu'au saut de ligne final, sans délai fixe ; le timeout court
+# (0.2s) ne sert que de garde-fou si l'appareil ne répond pas. Les caractères invalides
+# sont remplacés au décodage (erreurs de type Unicode).
+def envoyer_batch(ser, commandes, nb_reponses):
+    ser.write(commandes)
+    return tuple(ser.read_until(b'\n', 128).decode('ascii', 'replace').strip() for _ in range(nb_reponses))
+
+# Analyse la réponse de MEAS1? en une seule passe : renvoie le texte à afficher
+# et la valeur numérique à tracer (None si surcharge, non numérique ou non finie).
+def parse_mesure(valeur, unite):
+    if valeur[:4] == "1E+9":  # surcharge
+        return "Surcharge", None
     try:
-        if valeur.startswith("1E+9"):
-            return None
-        return float(valeur)
+        val = float(valeur)
     except ValueError:
-        return None
+        return valeur, None
+    return f"{val:.3f} {unite}", (val if math.isfinite(val) else None)
 
 unites = {
     "VOLT": "V",
@@ -85,6 +103,57 @@ modes_fran = {
     "CONT": "Continuité"
 }
 
+# Interroge le multimètre dans son propre QThread : les allers-retours série ne bloquent
+# plus la boucle d'événements de l'interface, qui ne fait que l'affichage.
+class SerialWorker(QtCore.QObject):
+    measurementReady = QtCore.pyqtSignal(str, str, str)  # mode, plage, mesure
+    erreur = QtCore.pyqtSignal(str)
+
+    def __init__(self, ser):
+        super().__init__()
+        self.ser = ser
+        self.timer = None
+        self.intervalle = INTERVALLE_MS
+
+    # Appelé au démarrage du thread : le timer est créé dans le thread du worker.
+    @QtCore.pyqtSlot()
+    def demarrer(self):
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.lire)
+        self.timer.start(INTERVALLE_MS)
+
+    @QtCore.pyqtSlot()
+    def lire(self):
+        try:
+            # Jette une réponse tardive à une requête précédente pour ne pas décaler les lectures
+            self.ser.reset_input_buffer()
+            mode, plage, val1 = envoyer_batch(self.ser, _CMD_LECTURE, 3)
+            if not val1:
+                raise TimeoutError("Pas de réponse")
+        except Exception as e:
+            # Multimètre absent ou port en erreur : on espace les tentatives
+            self.changer_intervalle(min(self.intervalle * 2, INTERVALLE_MAX_MS))
+            self.erreur.emit(str(e))
+            return
+        self.changer_intervalle(INTERVALLE_MS)
+        self.measurementReady.emit(mode.strip('"'), plage, val1)
+
+    def changer_intervalle(self, intervalle):
+        if intervalle != self.intervalle:
+            self.intervalle = intervalle
+            self.timer.setInterval(intervalle)
+
+    # Appelé à la fin du thread : rend la main au panneau avant de fermer le port.
+    @QtCore.pyqtSlot()
+    def arreter(self):
+        if self.timer is not None:
+            self.timer.stop()
+        try:
+            self.ser.write(b"SYST:LOC\n")
+            self.ser.close()
+        except:
+            pass
+
 class MultimetreApp(QWidget):
     def __init__(self, port, afficher_graphique=True):
         super().__init__()
@@ -142,91 +211,195 @@ class MultimetreApp(QWidget):
 
         layout.addLayout(self.grid)
 
+        # Méthodes setText pré-liées, appelées à chaque lecture
+        self._set_mode = self.labels["MODE"].setText
+        self._set_plage = self.labels["PLAGE"].setText
+        self._set_mes = self.labels["MESURE"].setText
+
         self.afficher_graphique = afficher_graphique
         if self.afficher_graphique:
-            self.canvas_fig = Figure(figsize=(5, 2.5), facecolor='#1e1e1e')
-            self.canvas_ax = self.canvas_fig.add_subplot(111)
-            self.canvas_ax.set_ylabel("Mesure", color='white')
-            self.canvas_ax.tick_params(axis='y', colors='white')
-            self.canvas_ax.set_xticks([])
-            self.canvas_ax.spines['bottom'].set_color('white')
-            self.canvas_ax.spines['top'].set_color('white')
-            self.canvas_ax.spines['right'].set_color('white')
-            self.canvas_ax.spines['left'].set_color('white')
-            self.canvas_line, = self.canvas_ax.plot([], [], lw=2, color='#90ee90')
-            self.canvas = FigureCanvas(self.canvas_fig)
-            layout.addWidget(self.canvas)
+            # Import différé : le mode sans graphique démarre sans charger pyqtgraph
+            import pyqtgraph as pg
+
+            # pyqtgraph dessine avec le QPainter natif : setData() suffit, Qt gère le rafraîchissement
+            self.plot = pg.PlotWidget(background='#1e1e1e')
+            self.plot.setMouseEnabled(x=False, y=False)
+            self.plot.disableAutoRange()
+            self.plot.hideButtons()
+            self.plot.showAxis('top')
+            self.plot.showAxis('right')
+            for nom in ('left', 'bottom', 'top', 'right'):
+                axe = self.plot.getAxis(nom)
+                axe.setPen('w')
+                axe.setTextPen('w')
+                if nom != 'left':
+                    axe.setStyle(showValues=False, tickLength=0)
+            self.plot.getAxis('left').enableAutoSIPrefix(False)
+            self.plot.setLabel('left', "Mesure", color='white')
+            self.curve = self.plot.plot(pen=pg.mkPen('#90ee90', width=2))
+            self._ylim = None
+            self._xlim = None
+            layout.addWidget(self.plot)
 
         self.setLayout(layout)
         self.layout().setContentsMargins(0, 0, 0, 0)  # CETTE ligne est la clé !
 
-        self.ser = serial.Serial(port, baudrate=baudrate, timeout=timeout)
+        # Accès exclusif au port (POSIX) ; sous Windows, tampons du pilote agrandis
+        self.ser = serial.Serial(port, baudrate=baudrate, timeout=timeout, exclusive=True)
+        if hasattr(self.ser, "set_buffer_size"):
+            self.ser.set_buffer_size(rx_size=4096, tx_size=1024)
         self.ser.write(b"SYST:REM\n")
 
-        self.historique = deque()
+        # Historique en deux tableaux parallèles (temps, valeur) formant un tampon circulaire.
+        # Chaque point est écrit deux fois (à i et i + N) pour que les N derniers points
+        # soient toujours lisibles sous forme de vue contiguë, sans copie.
+        self.hx = np.empty(2 * TAILLE_HISTORIQUE, dtype=np.float64)
+        self.hy = np.empty(2 * TAILLE_HISTORIQUE, dtype=np.float64)
+        # Candidats (rang, valeur) au minimum et au maximum de la fenêtre, en deques monotones
+        self.cand_min = deque()
+        self.cand_max = deque()
+        self.vider_historique()
+        # Les étiquettes sont mises à jour à chaque lecture, le graphique une fois sur plot_skip
+        self.plot_skip = plot_skip
+        self.tick = 0
         self.dernier_mode = ""
         self.dernier_plage = ""
         self.dernier_unite = ""
         self.start_time = time.time()
 
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.update_valeurs)
-        self.timer.start(500)
+        self.serial_thread = QtCore.QThread()
+        self.worker = SerialWorker(self.ser)
+        self.worker.moveToThread(self.serial_thread)
+        self.serial_thread.started.connect(self.worker.demarrer)
+        self.serial_thread.finished.connect(self.worker.arreter)
+        self.worker.measurementReady.connect(self.update_valeurs)
+        self.worker.erreur.connect(self.afficher_erreur)
+        # Arrête aussi le thread si l'application quitte sans fermer la fenêtre (app.quit(), ...)
+        QApplication.instance().aboutToQuit.connect(self.arreter_lecture)
+        self.serial_thread.start()
 
-    # Rafraîchit les données toutes les 0.5 secondes, met à jour l'affichage graphique
-    # et gère les changements de mode ou de plage.
-    def update_valeurs(self):
+    # Reçoit chaque lecture du SerialWorker (au mieux toutes les 0.1 secondes), met à jour
+    # l'affichage graphique et gère les changements de mode ou de plage.
+    def update_valeurs(self, mode, plage, val1):
+        maintenant = time.time
         try:
-            mode = envoyer_commande(self.ser, "FUNC1?").strip('"')
-            plage = envoyer_commande(self.ser, "RANGE?")
-            val1 = envoyer_commande(self.ser, "MEAS1?")
-
-            mode_str = modes_fran.get(mode.upper(), mode)
-            unite = unites.get(mode.upper(), "")
-            val_formatee = formater_mesure(val1, unite)
+            mode_key = mode.upper()
+            mode_str = modes_fran.get(mode_key, mode)
+            unite = unites.get(mode_key, "")
+            val_formatee, val = parse_mesure(val1, unite)
 
             if mode != self.dernier_mode or plage != self.dernier_plage:
-                self.historique.clear()
-                self.start_time = time.time()
+                self.vider_historique()
+                self.tick = 0  # la première lecture du nouveau mode est tracée
+                self.start_time = maintenant()
                 if self.afficher_graphique:
-                    self.canvas_ax.set_title(mode_str, color='white')
+                    self.plot.setTitle(mode_str, color='white')
+                    self.plot.setLabel('left', unite, color='white')
+                    self.curve.setData([], [])
+                    self._ylim = None
+                    self._xlim = None
                 self.dernier_mode = mode
                 self.dernier_plage = plage
                 self.dernier_unite = unite
 
-            self.labels["MODE"].setText(mode_str)
-            self.labels["PLAGE"].setText(plage)
-            self.labels["MESURE"].setText(val_formatee)
+            self._set_mode(mode_str)
+            self._set_plage(plage)
+            self._set_mes(val_formatee)
 
-            val = extraire_float(val1)
             if val is not None and self.afficher_graphique:
-                temps = time.time() - self.start_time
-                self.historique.append((temps, val))
-                while self.historique and self.historique[0][0] < temps - 60:
-                    self.historique.popleft()
-
-                if self.historique:
-                    x_vals, y_vals = zip(*self.historique)
-                    self.canvas_line.set_data(x_vals, y_vals)
-                    min_y, max_y = min(y_vals), max(y_vals)
+                temps = maintenant() - self.start_time
+                self.ajouter_point(temps, val)
+
+                tracer = self.tick % self.plot_skip == 0
+                self.tick += 1
+                if tracer:
+                    # Vues float64 contiguës du tampon, passées telles quelles (ni copie ni conversion) ;
+                    # l'historique ne contient que des valeurs finies, le contrôle de pyqtgraph est inutile.
+                    x_vals, y_vals = self.vues_historique()
+                    self.curve.setData(x_vals, y_vals, skipFiniteCheck=True)
+                    min_y, max_y = self.win_min, self.win_max
                     marge = max(0.05 * (max_y - min_y), 0.01)
-                    self.canvas_ax.set_ylim(min_y - marge, max_y + marge)
-                    self.canvas_ax.set_xlim(max(0, temps - 60), temps)
-                    self.canvas_ax.set_ylabel(self.dernier_unite, color='white')
-                    self.canvas_ax.ticklabel_format(style='plain', useOffset=False)
-                    self.canvas.draw()
+                    lo, hi = min_y - marge, max_y + marge
+                    if self.limites_y_changees(lo, hi, min_y, max_y):
+                        self._ylim = (lo, hi)
+                        self.plot.setYRange(lo, hi, padding=0)
+                    if self._xlim is None or temps > self._xlim[1]:
+                        self._xlim = (max(0, temps - FENETRE_HISTORIQUE), temps + AVANCE_XLIM)
+                        self.plot.setXRange(*self._xlim, padding=0)
         except Exception as e:
-            self.labels["MODE"].setText("Erreur")
-            self.labels["PLAGE"].setText("--")
-            self.labels["MESURE"].setText(str(e))
+            self.afficher_erreur(str(e))
+
+    def afficher_erreur(self, message):
+        self._set_mode("Erreur")
+        self._set_plage("--")
+        self._set_mes(message)
+
+    # Les limites Y ne sont modifiées que si une mesure sort de l'axe ou si l'une d'elles
+    # bouge de plus de SEUIL_YLIM de l'étendue actuelle : chaque changement recalcule les graduations.
+    def limites_y_changees(self, lo, hi, min_y, max_y):
+        if self._ylim is None:
+            return True
+        old_lo, old_hi = self._ylim
+        if min_y < old_lo or max_y > old_hi:
+            return True
+        seuil = SEUIL_YLIM * (old_hi - old_lo)
+        return abs(lo - old_lo) > seuil or abs(hi - old_hi) > seuil
+
+    def vider_historique(self):
+        self.hi = 0  # index d'écriture
+        self.hn = 0  # nombre de points valides
+        self.rang = 0  # nombre total de points ajoutés depuis la remise à zéro
+        self.cand_min.clear()
+        self.cand_max.clear()
+        self.win_min = self.win_max = None
+
+    # Ajoute un point au tampon circulaire de l'historique (écrase le plus ancien si plein).
+    # Les points plus vieux que FENETRE_HISTORIQUE sont aussi écartés : si les lectures
+    # prennent du retard, le tampon couvrirait sinon plus que la fenêtre affichée.
+    # Le minimum et le maximum de la fenêtre sont tenus à jour en O(1) amorti : chaque deque
+    # ne garde que les points encore susceptibles de devenir l'extremum, le plus ancien en tête.
+    def ajouter_point(self, temps, val):
+        i = self.hi
+        self.hx[i] = self.hx[i + TAILLE_HISTORIQUE] = temps
+        self.hy[i] = self.hy[i + TAILLE_HISTORIQUE] = val
+        self.hi = (i + 1) % TAILLE_HISTORIQUE
+        if self.hn < TAILLE_HISTORIQUE:
+            self.hn += 1
+        limite = temps - FENETRE_HISTORIQUE
+        while self.hx[self.hi + TAILLE_HISTORIQUE - self.hn] < limite:
+            self.hn -= 1
+
+        rang = self.rang
+        self.rang += 1
+        expire = self.rang - self.hn  # rang du plus ancien point conservé
+        while self.cand_min and self.cand_min[-1][1] >= val:
+            self.cand_min.pop()
+        self.cand_min.append((rang, val))
+        while self.cand_min[0][0] < expire:
+            self.cand_min.popleft()
+
+        while self.cand_max and self.cand_max[-1][1] <= val:
+            self.cand_max.pop()
+        self.cand_max.append((rang, val))
+        while self.cand_max[0][0] < expire:
+            self.cand_max.popleft()
+
+        self.win_min = self.cand_min[0][1]
+        self.win_max = self.cand_max[0][1]
+
+    # Renvoie les points de l'historique (du plus ancien au plus récent) en vues contiguës.
+    def vues_historique(self):
+        fin = self.hi + TAILLE_HISTORIQUE
+        return self.hx[fin - self.hn:fin], self.hy[fin - self.hn:fin]
+
+    # Termine le thread série ; SerialWorker.arreter() rend alors la main au panneau.
+    def arreter_lecture(self):
+        if self.serial_thread.isRunning():
+            self.serial_thread.quit()
+            self.serial_thread.wait()
 
     def closeEvent(self, event):
-        self.timer.stop()
-        try:
-            self.ser.write(b"SYST:LOC\n")
-            self.ser.close()
-        except:
-            pass
+        self.arreter_lecture()
         event.accept()
 
 if __name__ == "__main__":